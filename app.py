@@ -4,6 +4,7 @@ from flask_cors import CORS
 from models import db, db_drop_and_create_all, setup_db, User, BlacklistToken, Course, Student, Teacher, Attendance, Enrollement
 from auth import encode_auth_token, decode_auth_token, requires_auth
 from attendance import generate_attendance_code, verify_attendance_code
+from listing import get_page_args, make_etag, not_modified, paginate, paginated_response
 
 import datetime
 
@@ -159,12 +160,14 @@ def add_course(payload):
     course_name = body.get('course_name')
     course_code = body.get('course_code')
     course_grade = body.get('course_grade')
+    course_term = body.get('course_term')
     course = Course.query.filter_by(code=course_code).first()
     if course:
         abort(409)
     try:
-        new_course = Course(code=course_code, name=course_name, grade=course_grade)
+        new_course = Course(code=course_code, name=course_name, grade=course_grade, term=course_term)
         new_course.teacher_id = payload.get('id')
+        User.bump_version(new_course.teacher_id)
         new_course.insert()
         return jsonify({
             'success': True,
@@ -192,6 +195,12 @@ def attend_class(payload):
     course = Course.query.filter_by(id=course_id).first()
     if not student or not course:
         abort(404)
+    if course.closed:
+        return make_response(jsonify({
+            "success": False,
+            "message": "This course's term has been closed",
+            "can_attends": False
+        })), 400
     
     resp = verify_attendance_code(secret_key=app.config.get('SECRET_KEY'), attendance_token=attendance_token_student)
     if not isinstance(resp, str):
@@ -214,6 +223,7 @@ def attend_class(payload):
             new_attendance = Attendance(attendance_time=datetime.datetime.strptime(attendance_time_student, '%Y-%m-%d %H:%M:%S.%f'), attendance_token=attendance_token_student)
             new_attendance.course = course
             student.attendances.append(new_attendance)
+            User.bump_version(student.id)
             new_attendance.insert()
             # db.session.commit()
             # 2- insert the token
@@ -249,6 +259,11 @@ def add_students(payload):
 
     if not course:
         abort(404)
+    if course.closed:
+        return make_response(jsonify({
+            "success": False,
+            "message": "This course's term has been closed"
+        })), 400
     
     for s in students_university_ids:
         student = Student.query.filter_by(university_id=s).first()
@@ -257,6 +272,8 @@ def add_students(payload):
         enroll = Enrollement()
         enroll.course = course
         student.courses.append(enroll)
+        Course.bump_version(course.id)
+        User.bump_version(student.id)
         student.update()
     
     return make_response(jsonify({
@@ -264,6 +281,85 @@ def add_students(payload):
         "message": "Students added successfully to the course"
     })), 200
 
+COURSE_FIELDS = ('id', 'name', 'code', 'grade', 'term')
+STUDENT_FIELDS = ('id', 'first_name', 'last_name', 'email', 'phone', 'university_id')
+ATTENDANCE_FIELDS = ('course_id', 'attendance_time')
+
+
+@app.route('/courses', methods=['GET'])
+@requires_auth()
+def list_courses(payload):
+    after, limit, fields = get_page_args(COURSE_FIELDS)
+    # Course details are never edited, so the page's keys alone identify its contents
+    ids = Course.query.with_entities(Course.id) \
+        .filter(Course.id > after) \
+        .order_by(Course.id) \
+        .limit(limit + 1) \
+        .all()
+    etag = make_etag('courses', [row.id for row in ids])
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    courses, next_after = paginate(Course.query, Course, 'id', fields, after, limit)
+    return paginated_response('courses', courses, next_after, etag)
+
+
+@app.route('/teachers/courses', methods=['GET'])
+@requires_auth('teacher')
+def list_teacher_courses(payload):
+    after, limit, fields = get_page_args(COURSE_FIELDS)
+    teacher_id = payload.get('id')
+    version = User.query.with_entities(User.version).filter_by(id=teacher_id).scalar()
+    if version is None:
+        abort(404)
+    etag = make_etag('teacher', teacher_id, version)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    courses, next_after = paginate(Course.query.filter_by(teacher_id=teacher_id), Course, 'id', fields, after, limit)
+    return paginated_response('courses', courses, next_after, etag)
+
+
+@app.route('/courses/<int:course_id>/students', methods=['GET'])
+@requires_auth('teacher')
+def list_course_students(payload, course_id):
+    after, limit, fields = get_page_args(STUDENT_FIELDS)
+    course = Course.query.with_entities(Course.teacher_id, Course.version).filter_by(id=course_id).first()
+    if not course:
+        abort(404)
+    if course.teacher_id != payload.get('id'):
+        abort(401)
+    etag = make_etag('course', course_id, course.version)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    query = Student.query.join(Enrollement, Enrollement.student_id == Student.id) \
+        .filter(Enrollement.course_id == course_id)
+    students, next_after = paginate(query, Student, 'id', fields, after, limit)
+    return paginated_response('students', students, next_after, etag)
+
+
+@app.route('/students/attendance', methods=['GET'])
+@requires_auth('student')
+def list_student_attendance(payload):
+    after, limit, fields = get_page_args(ATTENDANCE_FIELDS)
+    student_id = payload.get('id')
+    version = User.query.with_entities(User.version).filter_by(id=student_id).scalar()
+    if version is None:
+        abort(404)
+    etag = make_etag('student', student_id, version)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    query = Attendance.query.filter_by(student_id=student_id)
+    attendances, next_after = paginate(query, Attendance, 'course_id', fields, after, limit)
+    return paginated_response('attendances', attendances, next_after, etag)
+
+
 # Error Handling
 @app.errorhandler(422)
 def unprocessable(error):
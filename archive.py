@@ -0,0 +1,229 @@
+import os
+import sys
+import sqlite3
+import calendar
+import datetime
+from jose import jwt
+from flask import Flask
+from sqlalchemy import and_, or_
+from models import db, setup_db, project_dir, database_filename, User, Course, Attendance, Enrollement, BlacklistToken
+
+archive_dir = os.path.join(project_dir, "archive")
+live_database_path = os.path.join(project_dir, database_filename)
+
+# Archived rows are stored keyed by course so each course's rows sit together
+# on disk, with timestamps packed into integer epoch microseconds.
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS term (
+    name TEXT PRIMARY KEY,
+    archived_on INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS attendance (
+    course_id INTEGER NOT NULL,
+    student_id INTEGER NOT NULL,
+    attendance_time INTEGER NOT NULL,
+    attendance_token TEXT NOT NULL,
+    PRIMARY KEY (course_id, student_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS enroll (
+    course_id INTEGER NOT NULL,
+    student_id INTEGER NOT NULL,
+    PRIMARY KEY (course_id, student_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS blacklist_tokens (
+    token TEXT PRIMARY KEY,
+    blacklisted_on INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def archive_path(term):
+    return os.path.join(archive_dir, "term_{}.db".format(term))
+
+
+# Renders epoch microseconds the way SQLAlchemy stores DateTime in the live database
+ARCHIVED_TIME_SQL = "strftime('%Y-%m-%d %H:%M:%S', {0} / 1000000, 'unixepoch') || '.' || printf('%06d', {0} % 1000000)"
+
+# Keeps IN (...) lists and key filters under SQLite's bound parameter limit
+DELETE_BATCH_SIZE = 500
+KEY_DELETE_BATCH_SIZE = DELETE_BATCH_SIZE // 2
+
+
+def to_epoch_micros(value):
+    return calendar.timegm(value.timetuple()) * 1000000 + value.microsecond
+
+
+def from_epoch_micros(value):
+    time = datetime.datetime(1970, 1, 1) + datetime.timedelta(microseconds=value)
+    return time.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def delete_keys(model, keys):
+    # Deletes exactly the (course_id, student_id) rows that were archived
+    for start in range(0, len(keys), KEY_DELETE_BATCH_SIZE):
+        model.query.filter(or_(*[
+            and_(model.course_id == course_id, model.student_id == student_id)
+            for course_id, student_id in keys[start:start + KEY_DELETE_BATCH_SIZE]
+        ])).delete(synchronize_session=False)
+
+
+def token_expired(token, now):
+    try:
+        claims = jwt.get_unverified_claims(token)
+    except jwt.JWTError:
+        return True
+    return claims.get('exp', 0) < now
+
+
+def rollover_term(term):
+    """
+    Closes a term and moves its attendance, enrollments and expired
+    blacklisted tokens out of the live database into the term's archive file.
+    Rows that arrive while the archive is written stay live and are picked
+    up by the next rollover of the same term.
+    :param term: the term name stored on its courses
+    :return: dict with the number of archived rows per table
+    """
+    course_ids = [c.id for c in Course.query.with_entities(Course.id).filter_by(term=term).all()]
+    if not course_ids:
+        raise ValueError("No courses found for term {}".format(term))
+
+    # Close the courses first so check-ins and enrollments stop being accepted
+    try:
+        Course.query.filter(Course.id.in_(course_ids)).update({Course.closed: True}, synchronize_session=False)
+        db.session.commit()
+    except:
+        db.session.rollback()
+        raise
+    now = datetime.datetime.utcnow()
+    now_seconds = calendar.timegm(now.timetuple())
+
+    attendances = db.session.query(
+        Attendance.course_id, Attendance.student_id, Attendance.attendance_time, Attendance.attendance_token) \
+        .filter(Attendance.course_id.in_(course_ids)) \
+        .all()
+    enrollements = db.session.query(Enrollement.course_id, Enrollement.student_id) \
+        .filter(Enrollement.course_id.in_(course_ids)) \
+        .all()
+    # Expiry lives inside the JWT, so tokens have to be checked here rather than in SQL
+    tokens = [t for t in db.session.query(BlacklistToken.id, BlacklistToken.token, BlacklistToken.blacklisted_on)
+              if token_expired(t.token, now_seconds)]
+    student_ids = set(row.student_id for row in attendances + enrollements)
+
+    os.makedirs(archive_dir, exist_ok=True)
+    connection = sqlite3.connect(archive_path(term))
+    try:
+        with connection:
+            connection.executescript(ARCHIVE_SCHEMA)
+            connection.execute("INSERT OR REPLACE INTO term (name, archived_on) VALUES (?, ?)",
+                               (term, to_epoch_micros(now)))
+            connection.executemany(
+                "INSERT OR IGNORE INTO attendance VALUES (?, ?, ?, ?)",
+                [(a.course_id, a.student_id, to_epoch_micros(a.attendance_time), a.attendance_token)
+                 for a in attendances])
+            connection.executemany(
+                "INSERT OR IGNORE INTO enroll VALUES (?, ?)",
+                [(e.course_id, e.student_id) for e in enrollements])
+            connection.executemany(
+                "INSERT OR IGNORE INTO blacklist_tokens VALUES (?, ?)",
+                [(t.token, to_epoch_micros(t.blacklisted_on)) for t in tokens])
+    finally:
+        connection.close()
+
+    # Only drop the live rows once the archive has been committed
+    try:
+        delete_keys(Attendance, [(a.course_id, a.student_id) for a in attendances])
+        delete_keys(Enrollement, [(e.course_id, e.student_id) for e in enrollements])
+        token_ids = [t.id for t in tokens]
+        for start in range(0, len(token_ids), DELETE_BATCH_SIZE):
+            BlacklistToken.query.filter(BlacklistToken.id.in_(token_ids[start:start + DELETE_BATCH_SIZE])) \
+                .delete(synchronize_session=False)
+        # Listings of the moved rows must not be served from cached ETags
+        for course_id in course_ids:
+            Course.bump_version(course_id)
+        for student_id in student_ids:
+            User.bump_version(student_id)
+        db.session.commit()
+    except:
+        db.session.rollback()
+        raise
+    finally:
+        db.session.close()
+
+    # VACUUM cannot run inside a transaction, so use a raw autocommit connection
+    vacuum = sqlite3.connect(live_database_path, isolation_level=None)
+    try:
+        vacuum.execute("VACUUM")
+    finally:
+        vacuum.close()
+
+    return {
+        'attendance': len(attendances),
+        'enroll': len(enrollements),
+        'blacklist_tokens': len(tokens)
+    }
+
+
+def connect_reports(*terms):
+    """
+    Opens a read-only connection to the live database with the given terms'
+    archives attached. The temporary views attendance_history and
+    enroll_history cover live and archived rows alike.
+    :return: sqlite3.Connection
+    """
+    connection = sqlite3.connect("file:{}?mode=ro".format(live_database_path), uri=True)
+    attendance_selects = ["SELECT student_id, course_id, attendance_time, attendance_token FROM main.attendance"]
+    enroll_selects = ["SELECT student_id, course_id FROM main.enroll"]
+    for index, term in enumerate(terms):
+        path = archive_path(term)
+        if not os.path.exists(path):
+            connection.close()
+            raise FileNotFoundError(path)
+        schema = "term_{}".format(index)
+        connection.execute("ATTACH DATABASE ? AS {}".format(schema), ("file:{}?mode=ro".format(path),))
+        attendance_selects.append(
+            "SELECT student_id, course_id, {}, attendance_token "
+            "FROM {}.attendance".format(ARCHIVED_TIME_SQL.format('attendance_time'), schema))
+        enroll_selects.append("SELECT student_id, course_id FROM {}.enroll".format(schema))
+    connection.execute("CREATE TEMP VIEW attendance_history AS " + " UNION ALL ".join(attendance_selects))
+    connection.execute("CREATE TEMP VIEW enroll_history AS " + " UNION ALL ".join(enroll_selects))
+    return connection
+
+
+def archived_attendance(term, course_id=None, student_id=None):
+    """
+    Reads attendance rows from a term's archive
+    :return: list of dicts shaped like the live attendance rows
+    """
+    connection = sqlite3.connect("file:{}?mode=ro".format(archive_path(term)), uri=True)
+    try:
+        query = "SELECT course_id, student_id, attendance_time FROM attendance WHERE 1 = 1"
+        params = []
+        if course_id is not None:
+            query += " AND course_id = ?"
+            params.append(course_id)
+        if student_id is not None:
+            query += " AND student_id = ?"
+            params.append(student_id)
+        return [{
+            'course_id': row[0],
+            'student_id': row[1],
+            'attendance_time': from_epoch_micros(row[2]),
+            'term': term
+        } for row in connection.execute(query, params)]
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    # Run as `python archive.py <term>`; importing app would reset the database
+    if len(sys.argv) != 2:
+        sys.exit("usage: python archive.py <term>")
+    app = Flask(__name__)
+    setup_db(app)
+    with app.app_context():
+        try:
+            counts = rollover_term(sys.argv[1])
+        except ValueError as e:
+            sys.exit(str(e))
+    print("Archived term {}: {}".format(sys.argv[1], counts))
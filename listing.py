@@ -0,0 +1,89 @@
+from flask import request, abort, jsonify, make_response
+import hashlib
+import datetime
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Same format attend_class accepts and the archive readers return
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def get_page_args(allowed_fields):
+    """
+    Reads the keyset cursor, page size and field projection from the query string
+    :param allowed_fields: field names the endpoint may return
+    :return: (after, limit, fields)
+    """
+    try:
+        after = int(request.args.get('after', 0))
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        abort(400)
+    if after < 0 or limit < 1:
+        abort(400)
+
+    fields = request.args.get('fields')
+    if fields:
+        fields = [f for f in fields.split(',') if f]
+        if not fields or any(f not in allowed_fields for f in fields):
+            abort(400)
+    else:
+        fields = list(allowed_fields)
+    return after, min(limit, MAX_PAGE_SIZE), fields
+
+
+def make_etag(*parts):
+    # The query string is part of the tag so each page/projection is cached separately
+    parts = parts + (request.query_string.decode(),)
+    return hashlib.sha1(':'.join(str(p) for p in parts).encode()).hexdigest()
+
+
+def not_modified(etag):
+    """
+    Builds a 304 response when the client already holds this ETag
+    :return: Response|None
+    """
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+    return None
+
+
+def format_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.strftime(DATETIME_FORMAT)
+    return value
+
+
+def paginate(query, model, cursor, fields, after, limit):
+    """
+    Fetches one keyset page ordered by the cursor column
+    :param query: base query, already filtered to the listed rows
+    :param cursor: name of the indexed key column used to seek
+    :return: (items, next_after) where next_after is None on the last page
+    """
+    cursor_column = getattr(model, cursor)
+    columns = [getattr(model, f) for f in fields]
+    if cursor not in fields:
+        columns.append(cursor_column)
+    rows = query.with_entities(*columns) \
+        .filter(cursor_column > after) \
+        .order_by(cursor_column) \
+        .limit(limit + 1) \
+        .all()
+
+    next_after = getattr(rows[limit - 1], cursor) if len(rows) > limit else None
+    items = [{f: format_value(getattr(row, f)) for f in fields} for row in rows[:limit]]
+    return items, next_after
+
+
+def paginated_response(name, items, next_after, etag):
+    response = make_response(jsonify({
+        'success': True,
+        name: items,
+        'next_after': next_after
+    }))
+    response.set_etag(etag)
+    return response
@@ -33,16 +33,26 @@ class Course(db.Model):
     name = Column(String, unique=True, nullable=False)
     code = Column(String, unique=True, nullable=False)
     grade = Column(String)
-    teacher_id = Column(ForeignKey('teacher.id'))
+    term = Column(String, index=True)
+    version = Column(Integer, nullable=False, default=0)
+    # Set once the course's term has been rolled over into its archive
+    closed = Column(Boolean, nullable=False, default=False)
+    teacher_id = Column(ForeignKey('teacher.id'), index=True)
     teacher = relationship('Teacher', back_populates="courses")
 
 
     students = relationship('Attendance', back_populates='course')
 
-    def __init__(self, name, code, grade):
+    def __init__(self, name, code, grade, term=None):
         self.name = name
         self.code = code
         self.grade = grade
+        self.term = term
+
+    @staticmethod
+    def bump_version(course_id):
+        # Tracks the course's roster so cached student listings are invalidated; committed with the caller's change
+        Course.query.filter_by(id=course_id).update({Course.version: Course.version + 1}, synchronize_session=False)
 
     def insert(self):
         db.session.add(self)
@@ -60,7 +70,8 @@ class Course(db.Model):
             'id': self.id,
             'name': self.name,
             'code': self.code,
-            'grade': self.grade
+            'grade': self.grade,
+            'term': self.term
         }
 
 
@@ -74,6 +85,7 @@ class User(db.Model):
     password = Column(String(255), nullable=False)
     phone = Column(String, unique=True, nullable=False)
     type = Column(String)
+    version = Column(Integer, nullable=False, default=0)
 
     __mapper_args__ = {
         "polymorphic_identity": "user",
@@ -88,6 +100,11 @@ class User(db.Model):
         self.phone = phone
         self.type = type
 
+    @staticmethod
+    def bump_version(user_id):
+        # Invalidates cached listings owned by this user; committed with the caller's change
+        User.query.filter_by(id=user_id).update({User.version: User.version + 1}, synchronize_session=False)
+
     def insert(self):
         db.session.add(self)
         db.session.commit()
@@ -170,7 +187,7 @@ class Enrollement(db.Model):
     __tablename__="enroll"
 
     student_id = Column(Integer, ForeignKey('student.id'), primary_key=True)
-    course_id = Column(Integer, ForeignKey('course.id'), primary_key=True)
+    course_id = Column(Integer, ForeignKey('course.id'), primary_key=True, index=True)
 
     course = relationship("Course")
 